@@ -0,0 +1,20 @@
+"""
+Shared config loader so config.json is read and parsed once per process.
+"""
+from functools import lru_cache
+from pathlib import Path
+
+import orjson
+
+CONFIG_PATH = Path(__file__).parent.parent / "config.json"
+
+
+def load_config(config_path: str | Path = CONFIG_PATH) -> dict:
+    """Read and parse a config file."""
+    return orjson.loads(Path(config_path).read_bytes())
+
+
+@lru_cache(maxsize=1)
+def get_config() -> dict:
+    """Get the process-wide config, loading it on first use."""
+    return load_config()
@@ -1,54 +1,105 @@
 """
 FastAPI backend for the Valentine's Candy Vending Machine.
 """
-import json
 import asyncio
+import logging
+import threading
 from pathlib import Path
 from contextlib import asynccontextmanager
+import orjson
+import ormsgpack
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from typing import Set
+from fastapi.responses import FileResponse, ORJSONResponse
+from typing import Dict
 
+from config import get_config
 from servo_controller import get_servo_controller
 from sensor import init_sensor
 
 
-# Load config
-config_path = Path(__file__).parent.parent / "config.json"
-with open(config_path) as f:
-    config = json.load(f)
+config = get_config()
+
+logger = logging.getLogger(__name__)
+
+# Max clients sent to per gather() before yielding back to the event loop
+BROADCAST_BATCH_SIZE = 50
+
+# Seconds a client gets to accept a broadcast frame before it's dropped
+BROADCAST_SEND_TIMEOUT = 1.0
+
+# WebSocket frame formats a client can pick with /ws?fmt=...
+WS_FORMATS = ("json", "msgpack")
 
 
 # Credit system
 class CreditManager:
     def __init__(self):
         self.credits = 0
-        self.websockets: Set[WebSocket] = set()
+        # Connected clients mapped to the frame format they asked for
+        self.websockets: Dict[WebSocket, str] = {}
         self._loop = None
+        self._loop_thread_id = None
+        self._dirty: asyncio.Event | None = None
+        self._broadcaster: asyncio.Task | None = None
+        # Pending close() calls for clients dropped on a send timeout
+        self._closing: set[asyncio.Task] = set()
+        # JSON state frame with the slot list baked in; slots never change at runtime
+        self._state_template: str | None = None
     
     def set_event_loop(self, loop):
         self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+    
+    def start_broadcaster(self):
+        """Start the background task that pushes state when it changes."""
+        self._dirty = asyncio.Event()
+        self._broadcaster = asyncio.create_task(self._broadcast_loop())
+    
+    async def stop_broadcaster(self):
+        """Stop the background broadcast task."""
+        if self._broadcaster:
+            self._broadcaster.cancel()
+            try:
+                await self._broadcaster
+            except asyncio.CancelledError:
+                pass
+            self._broadcaster = None
+    
+    async def _broadcast_loop(self):
+        """Broadcast once per burst of changes, always with the latest state."""
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            try:
+                await self.broadcast_state()
+            except Exception:
+                logger.exception("Broadcast failed")
     
     def add_credits(self, amount: int = 1):
         self.credits += amount
-        print(f"Credits added: {amount}. Total: {self.credits}")
-        self._schedule_broadcast()
+        logger.debug("Credits added: %s. Total: %s", amount, self.credits)
+        self.schedule_broadcast()
     
     def spend_credits(self, amount: int = 1) -> bool:
         if self.credits >= amount:
             self.credits -= amount
-            print(f"Credits spent: {amount}. Remaining: {self.credits}")
-            self._schedule_broadcast()
+            logger.debug("Credits spent: %s. Remaining: %s", amount, self.credits)
+            self.schedule_broadcast()
             return True
         return False
     
-    def _schedule_broadcast(self):
-        """Schedule broadcast on the main event loop (thread-safe)."""
-        if self._loop:
-            self._loop.call_soon_threadsafe(
-                lambda: asyncio.create_task(self.broadcast_state())
-            )
+    def schedule_broadcast(self):
+        """Mark state dirty so the broadcaster picks it up (thread-safe)."""
+        if not self._loop or not self._dirty:
+            return
+        
+        if threading.get_ident() == self._loop_thread_id:
+            # Called from a request handler - already on the loop
+            self._dirty.set()
+        else:
+            # Called from the GPIO callback thread
+            self._loop.call_soon_threadsafe(self._dirty.set)
     
     def get_credits(self) -> int:
         return self.credits
@@ -59,27 +110,101 @@ class CreditManager:
             return
         
         servo = get_servo_controller()
-        state = {
+        credits = self.credits
+        busy = servo.is_busy()
+        
+        # Encode once per format and reuse the same frame for every client
+        sockets = list(self.websockets.items())
+        json_payload = self._encode_state_json(credits, busy)
+        msgpack_payload = None
+        if any(fmt == "msgpack" for _, fmt in sockets):
+            msgpack_payload = self._encode_state_msgpack(credits, busy)
+        
+        # Send to all clients concurrently so one slow socket doesn't delay the rest
+        if len(sockets) <= BROADCAST_BATCH_SIZE:
+            await self._send_batch(sockets, json_payload, msgpack_payload)
+            return
+        
+        # Lots of clients: send in batches and yield between them so
+        # dispense and sensor callbacks aren't starved
+        for i in range(0, len(sockets), BROADCAST_BATCH_SIZE):
+            await self._send_batch(
+                sockets[i:i + BROADCAST_BATCH_SIZE], json_payload, msgpack_payload
+            )
+            await asyncio.sleep(0)
+    
+    async def send_state(self, ws: WebSocket, fmt: str):
+        """Send current state to a single client, e.g. when it first connects."""
+        credits = self.credits
+        busy = get_servo_controller().is_busy()
+        if fmt == "msgpack":
+            await ws.send_bytes(self._encode_state_msgpack(credits, busy))
+        else:
+            await ws.send_text(self._encode_state_json(credits, busy))
+    
+    def _encode_state_msgpack(self, credits: int, busy: bool) -> bytes:
+        """Build the msgpack state frame."""
+        return ormsgpack.packb({
             "type": "state",
-            "credits": self.credits,
-            "slots": servo.get_enabled_slots(),
-            "busy": servo.is_busy()
-        }
+            "credits": credits,
+            "slots": get_servo_controller().get_enabled_slots(),
+            "busy": busy
+        })
+    
+    def _encode_state_json(self, credits: int, busy: bool) -> str:
+        """Build the JSON state frame from the cached template."""
+        if self._state_template is None:
+            slots_json = orjson.dumps(get_servo_controller().get_enabled_slots()).decode()
+            # Escape % so slot names can't break the format string
+            self._state_template = (
+                '{"type":"state","credits":%d,"slots":'
+                + slots_json.replace("%", "%%")
+                + ',"busy":%s}'
+            )
         
-        dead_sockets = set()
-        for ws in self.websockets:
-            try:
-                await ws.send_json(state)
-            except Exception:
-                dead_sockets.add(ws)
+        return self._state_template % (credits, "true" if busy else "false")
+    
+    async def _send_batch(
+        self,
+        sockets: list[tuple[WebSocket, str]],
+        json_payload: str,
+        msgpack_payload: bytes | None
+    ):
+        """Send the pre-encoded state to a batch of clients, dropping any that fail."""
+        # A slow client times out and is dropped rather than holding up the batch
+        results = await asyncio.gather(
+            *(
+                asyncio.wait_for(
+                    ws.send_bytes(msgpack_payload) if fmt == "msgpack"
+                    else ws.send_text(json_payload),
+                    timeout=BROADCAST_SEND_TIMEOUT
+                )
+                for ws, fmt in sockets
+            ),
+            return_exceptions=True
+        )
         
-        self.websockets -= dead_sockets
+        for (ws, _), result in zip(sockets, results):
+            if isinstance(result, Exception):
+                self.websockets.pop(ws, None)
+                if isinstance(result, asyncio.TimeoutError):
+                    # Still connected but stalled - close it so the client reconnects
+                    task = asyncio.create_task(self._close_quietly(ws))
+                    self._closing.add(task)
+                    task.add_done_callback(self._closing.discard)
+    
+    async def _close_quietly(self, ws: WebSocket):
+        """Close a stalled client, ignoring any errors."""
+        try:
+            await asyncio.wait_for(ws.close(code=1013), timeout=BROADCAST_SEND_TIMEOUT)
+        except Exception:
+            pass
     
-    def register_websocket(self, ws: WebSocket):
-        self.websockets.add(ws)
+    def register_websocket(self, ws: WebSocket, fmt: str = "json"):
+        self.websockets[ws] = fmt
     
     def unregister_websocket(self, ws: WebSocket):
-        self.websockets.discard(ws)
+        self.websockets.pop(ws, None)
 
 
 credit_manager = CreditManager()
@@ -97,6 +222,7 @@ async def lifespan(app: FastAPI):
     print("Starting Valentine's Candy Machine...")
     # Set event loop for thread-safe callbacks
     credit_manager.set_event_loop(asyncio.get_running_loop())
+    credit_manager.start_broadcaster()
     sensor = init_sensor(on_trigger=on_envelope_detected)
     sensor.start()
     yield
@@ -104,10 +230,15 @@ async def lifespan(app: FastAPI):
     print("Shutting down...")
     sensor.stop()
     sensor.cleanup()
+    await credit_manager.stop_broadcaster()
     get_servo_controller().stop_all()
 
 
-app = FastAPI(title="Valentine's Candy Machine", lifespan=lifespan)
+app = FastAPI(
+    title="Valentine's Candy Machine",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
 
 
 # Serve static files (frontend)
@@ -144,20 +275,18 @@ async def dispense(slot_id: int):
     if not credit_manager.spend_credits(cost):
         raise HTTPException(status_code=400, detail="Not enough credits")
     
-    # Broadcast busy state
-    await credit_manager.broadcast_state()
-    
-    # Run dispense in background to not block
-    loop = asyncio.get_event_loop()
-    success = await loop.run_in_executor(None, servo.dispense, slot_id)
+    # Dispense sleeps on the event loop, so no executor thread is tied up.
+    # spend_credits already queued a broadcast, which goes out once dispense
+    # yields, so clients get the new credits and busy state in one frame.
+    success = await servo.dispense(slot_id)
     
     if not success:
         # Refund credits if dispense failed
         credit_manager.add_credits(cost)
         raise HTTPException(status_code=500, detail="Dispense failed")
     
-    # Broadcast updated state after dispense
-    await credit_manager.broadcast_state()
+    # Broadcast idle state after dispense
+    credit_manager.schedule_broadcast()
     
     return {"success": True, "credits_remaining": credit_manager.get_credits()}
 
@@ -172,13 +301,21 @@ async def simulate_envelope():
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket for real-time state updates."""
+    """WebSocket for real-time state updates.
+    
+    Frames are JSON text by default; connect with ?fmt=msgpack to get
+    msgpack-encoded binary frames instead.
+    """
+    fmt = websocket.query_params.get("fmt", "json")
+    if fmt not in WS_FORMATS:
+        fmt = "json"
+    
     await websocket.accept()
-    credit_manager.register_websocket(websocket)
+    credit_manager.register_websocket(websocket, fmt)
     
     try:
-        # Send initial state
-        await credit_manager.broadcast_state()
+        # Send initial state to this client only
+        await credit_manager.send_state(websocket, fmt)
         
         # Keep connection alive and handle messages
         while True:
@@ -193,9 +330,14 @@ async def websocket_endpoint(websocket: WebSocket):
 
 if __name__ == "__main__":
     import uvicorn
+    # Hot-path sensor/servo messages log at DEBUG; keep them off in production
+    logging.basicConfig(level=logging.INFO)
     server_config = config.get("server", {})
     uvicorn.run(
         app,
         host=server_config.get("host", "0.0.0.0"),
-        port=server_config.get("port", 8000)
+        port=server_config.get("port", 8000),
+        # State frames are a few hundred bytes; deflating them per client
+        # costs more CPU than the bytes it saves
+        ws_per_message_deflate=False
     )
@@ -1,12 +1,13 @@
 """
 IR break-beam sensor module for detecting envelopes.
 """
-import json
 import time
 import asyncio
-from pathlib import Path
+import logging
 from typing import Callable
 
+from config import get_config, load_config
+
 # Will be None on non-Pi systems for development
 try:
     import RPi.GPIO as GPIO
@@ -15,31 +16,37 @@ except (ImportError, RuntimeError):
     PI_AVAILABLE = False
     GPIO = None
 
+# gpiozero on the lgpio backend - RPi.GPIO's edge detection is what fails
+# when we need this fallback, so don't let gpiozero pick RPi.GPIO
+try:
+    from gpiozero import DigitalInputDevice
+    from gpiozero.pins.lgpio import LGPIOFactory
+except ImportError:
+    DigitalInputDevice = None
+    LGPIOFactory = None
+
+logger = logging.getLogger(__name__)
+
 
 class BreakBeamSensor:
     """Monitors IR break-beam sensor and triggers callbacks on detection."""
     
     def __init__(self, config_path: str = None, on_trigger: Callable = None):
-        self.config = self._load_config(config_path)
+        self.config = load_config(config_path) if config_path else get_config()
         self.on_trigger = on_trigger
-        self.last_trigger_time = 0
-        self._running = False
+        self.last_trigger_ns = 0
+        self._device = None
         
         sensor_config = self.config["sensor"]
         self.gpio_pin = sensor_config["gpio_pin"]
         self.cooldown_ms = sensor_config.get("cooldown_ms", 2000)
+        self.cooldown_ns = int(self.cooldown_ms) * 1_000_000
         
         if PI_AVAILABLE:
             self._setup_gpio()
         else:
             print("Running in development mode - sensor will be simulated")
     
-    def _load_config(self, config_path: str = None) -> dict:
-        if config_path is None:
-            config_path = Path(__file__).parent.parent / "config.json"
-        with open(config_path) as f:
-            return json.load(f)
-    
     def _setup_gpio(self):
         """Initialize GPIO for the break-beam sensor."""
         GPIO.setmode(GPIO.BCM)
@@ -48,23 +55,21 @@ class BreakBeamSensor:
     
     def _handle_beam_break(self, channel):
         """Callback for GPIO edge detection."""
-        current_time = time.time() * 1000  # ms
+        # Monotonic clock so wall-clock jumps can't break the cooldown
+        now = time.monotonic_ns()
         
         # Check cooldown to prevent double-triggers
-        if current_time - self.last_trigger_time < self.cooldown_ms:
+        if now - self.last_trigger_ns < self.cooldown_ns:
             return
         
-        self.last_trigger_time = current_time
-        print(f"Beam broken on GPIO {channel}!")
+        self.last_trigger_ns = now
+        logger.debug("Beam broken on GPIO %s!", channel)
         
         if self.on_trigger:
             self.on_trigger()
     
     def start(self):
         """Start monitoring the sensor."""
-        self._running = True
-        self._polling = False
-        
         if PI_AVAILABLE:
             # Try edge detection first (instant response)
             try:
@@ -77,35 +82,46 @@ class BreakBeamSensor:
                 print("Sensor monitoring started (GPIO interrupt)")
             except RuntimeError as e:
                 print(f"Warning: Could not set up GPIO edge detection: {e}")
-                print("Falling back to polling mode...")
-                self._polling = True
-                self._start_polling()
+                print("Falling back to gpiozero...")
+                self._start_gpiozero()
         else:
             print("Sensor monitoring started (simulation mode)")
     
-    def _start_polling(self):
-        """Start polling the sensor in a background thread."""
-        import threading
+    def _start_gpiozero(self):
+        """Watch the sensor with gpiozero's edge detection and debounce."""
+        if DigitalInputDevice is None:
+            print("Warning: gpiozero/lgpio not installed - sensor will not be monitored")
+            return
         
-        def poll_loop():
-            last_state = GPIO.input(self.gpio_pin)
-            while self._running:
-                current_state = GPIO.input(self.gpio_pin)
-                # Detect falling edge (HIGH to LOW = beam broken)
-                if last_state == 1 and current_state == 0:
-                    self._handle_beam_break(self.gpio_pin)
-                last_state = current_state
-                time.sleep(0.05)  # Poll every 50ms
+        # Release the pin from RPi.GPIO so gpiozero's pin factory can claim it
+        GPIO.cleanup(self.gpio_pin)
         
-        self._poll_thread = threading.Thread(target=poll_loop, daemon=True)
-        self._poll_thread.start()
-        print("Sensor monitoring started (polling mode)")
+        device = None
+        try:
+            # With pull_up=True the pin reads active when LOW, i.e. beam broken
+            device = DigitalInputDevice(
+                self.gpio_pin,
+                pull_up=True,
+                bounce_time=0.02,
+                pin_factory=LGPIOFactory()
+            )
+            device.when_activated = lambda: self._handle_beam_break(self.gpio_pin)
+        except Exception as e:
+            if device:
+                device.close()
+            print(f"Warning: Could not set up gpiozero edge detection: {e}")
+            print("Sensor will not be monitored")
+            return
+        
+        self._device = device
+        print("Sensor monitoring started (gpiozero)")
     
     def stop(self):
         """Stop monitoring the sensor."""
-        self._running = False
-        
-        if PI_AVAILABLE and not getattr(self, '_polling', False):
+        if self._device:
+            self._device.close()
+            self._device = None
+        elif PI_AVAILABLE:
             try:
                 GPIO.remove_event_detect(self.gpio_pin)
             except Exception:
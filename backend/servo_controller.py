@@ -1,9 +1,11 @@
 """
 Servo controller module for PCA9685-based continuous rotation servos.
 """
-import time
-import json
-from pathlib import Path
+import asyncio
+import logging
+import threading
+
+from config import get_config, load_config
 
 # Will be None on non-Pi systems for development
 try:
@@ -13,14 +15,21 @@ except (ImportError, NotImplementedError):
     PI_AVAILABLE = False
     ServoKit = None
 
+logger = logging.getLogger(__name__)
+
 
 class ServoController:
     """Controls continuous rotation servos via PCA9685."""
     
     def __init__(self, config_path: str = None):
-        self.config = self._load_config(config_path)
+        self.config = load_config(config_path) if config_path else get_config()
         self.kit = None
         self._busy = False
+        self._busy_lock = threading.Lock()
+        
+        # Slot config doesn't change at runtime, so index it once
+        self._enabled_slots = [s for s in self.config["slots"] if s.get("enabled", True)]
+        self._slot_by_id = {s["id"]: s for s in self._enabled_slots}
         
         if PI_AVAILABLE:
             try:
@@ -32,70 +41,65 @@ class ServoController:
         else:
             print("Running in development mode - servo commands will be simulated")
     
-    def _load_config(self, config_path: str = None) -> dict:
-        if config_path is None:
-            config_path = Path(__file__).parent.parent / "config.json"
-        with open(config_path) as f:
-            return json.load(f)
-    
     def get_slot_config(self, slot_id: int) -> dict | None:
         """Get configuration for a specific slot."""
-        for slot in self.config["slots"]:
-            if slot["id"] == slot_id and slot.get("enabled", True):
-                return slot
-        return None
+        return self._slot_by_id.get(slot_id)
     
     def get_enabled_slots(self) -> list[dict]:
         """Get all enabled slots."""
-        return [s for s in self.config["slots"] if s.get("enabled", True)]
+        return self._enabled_slots
     
     def is_busy(self) -> bool:
         """Check if a dispense is currently in progress."""
         return self._busy
     
-    def dispense(self, slot_id: int) -> bool:
+    async def dispense(self, slot_id: int) -> bool:
         """
         Spin the servo for the specified slot to dispense candy.
         Returns True if successful, False if slot not found or busy.
         """
-        if self._busy:
-            print(f"Cannot dispense: already busy")
-            return False
-        
         slot = self.get_slot_config(slot_id)
         if not slot:
             print(f"Slot {slot_id} not found or disabled")
             return False
         
+        with self._busy_lock:
+            if self._busy:
+                print(f"Cannot dispense: already busy")
+                return False
+            self._busy = True
+        
         channel = slot["channel"]
         duration_ms = slot.get("spin_duration_ms", 2000)
         speed = self.config["servo"].get("speed", 0.5)
         
-        self._busy = True
         try:
-            self._spin_servo(channel, speed, duration_ms)
+            await self._spin_servo(channel, speed, duration_ms)
             return True
         finally:
-            self._busy = False
+            with self._busy_lock:
+                self._busy = False
     
-    def _spin_servo(self, channel: int, speed: float, duration_ms: int):
+    async def _spin_servo(self, channel: int, speed: float, duration_ms: int):
         """
         Spin a continuous rotation servo.
         Speed: -1.0 (full reverse) to 1.0 (full forward), 0 = stop
         """
-        print(f"Spinning servo on channel {channel} at speed {speed} for {duration_ms}ms")
+        logger.debug("Spinning servo on channel %s at speed %s for %sms", channel, speed, duration_ms)
         
         if self.kit:
             # For continuous rotation servos:
             # throttle = -1.0 to 1.0, where 0 is stopped
             self.kit.continuous_servo[channel].throttle = speed
-            time.sleep(duration_ms / 1000.0)
-            self.kit.continuous_servo[channel].throttle = 0
+            try:
+                await asyncio.sleep(duration_ms / 1000.0)
+            finally:
+                self.kit.continuous_servo[channel].throttle = 0
         else:
             # Simulate on non-Pi systems
-            time.sleep(duration_ms / 1000.0)
+            await asyncio.sleep(duration_ms / 1000.0)
         
-        print(f"Servo on channel {channel} stopped")
+        logger.debug("Servo on channel %s stopped", channel)
     
     def stop_all(self):
         """Emergency stop all servos."""
@@ -6,6 +6,8 @@ class CandyMachine {
         this.slots = [];
         this.busy = false;
         this.ws = null;
+        // Opt in to binary msgpack frames by opening the page with ?fmt=msgpack
+        this.useMsgpack = new URLSearchParams(window.location.search).get('fmt') === 'msgpack';
         
         this.creditsEl = document.getElementById('credits');
         this.slotsEl = document.getElementById('slots');
@@ -63,9 +65,27 @@ class CandyMachine {
     
     async init() {
         await this.fetchState();
+        if (this.useMsgpack) {
+            await this.loadMsgpack();
+        }
         this.connectWebSocket();
     }
     
+    loadMsgpack() {
+        // Only pull in the decoder when msgpack frames were requested
+        return new Promise((resolve) => {
+            const script = document.createElement('script');
+            script.src = '/static/msgpack.js';
+            script.onload = resolve;
+            script.onerror = () => {
+                console.error('Failed to load msgpack decoder, falling back to JSON');
+                this.useMsgpack = false;
+                resolve();
+            };
+            document.head.appendChild(script);
+        });
+    }
+    
     async fetchState() {
         try {
             const response = await fetch('/api/state');
@@ -79,16 +99,20 @@ class CandyMachine {
     
     connectWebSocket() {
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        const wsUrl = `${protocol}//${window.location.host}/ws`;
+        const query = this.useMsgpack ? '?fmt=msgpack' : '';
+        const wsUrl = `${protocol}//${window.location.host}/ws${query}`;
         
         this.ws = new WebSocket(wsUrl);
+        this.ws.binaryType = 'arraybuffer';
         
         this.ws.onopen = () => {
             console.log('WebSocket connected');
         };
         
         this.ws.onmessage = (event) => {
-            const data = JSON.parse(event.data);
+            const data = typeof event.data === 'string'
+                ? JSON.parse(event.data)
+                : msgpack.decode(new Uint8Array(event.data));
             if (data.type === 'state') {
                 this.updateState(data);
             }